@@ -7,15 +7,63 @@ This script installs all required dependencies for Python-only local LLM
 import subprocess
 import sys
 import os
+import re
+import shutil
+import importlib.util
+from importlib import metadata
 
-def install_package(package):
-    """Install a Python package using pip"""
+try:
+    from packaging.requirements import Requirement
+except ImportError:
+    Requirement = None
+
+def uv_command():
+    """Find uv, installing it with pip if needed; None if unavailable"""
+    if shutil.which("uv"):
+        return ["uv"]
+    
+    if importlib.util.find_spec("uv") is None:
+        print("📦 Installing uv for faster package installs...")
+        try:
+            subprocess.check_call([sys.executable, "-m", "pip", "install", "uv"])
+        except subprocess.CalledProcessError:
+            return None
+    
+    return [sys.executable, "-m", "uv"]
+
+def install_packages(packages):
+    """Install Python packages with uv, falling back to a single pip invocation"""
+    uv = uv_command()
+    if uv:
+        try:
+            # Target this interpreter rather than whatever environment uv would pick
+            subprocess.check_call([*uv, "pip", "install", "--python", sys.executable, *packages])
+            return True
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            print(f"uv install failed ({e}), falling back to pip")
+    
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+        subprocess.check_call([sys.executable, "-m", "pip", "install", *packages])
         return True
     except subprocess.CalledProcessError as e:
-        print(f"Failed to install {package}: {e}")
+        print(f"Failed to install {', '.join(packages)}: {e}")
+        return False
+
+def is_satisfied(package):
+    """Check if an installed distribution already satisfies a requirement"""
+    if Requirement is None:
+        # Without packaging we can only check that something is installed
+        name, specifier = re.split(r"[<>=!~ ]", package, 1)[0], None
+    else:
+        requirement = Requirement(package)
+        name, specifier = requirement.name, requirement.specifier
+    
+    try:
+        version = metadata.version(name)
+    except metadata.PackageNotFoundError:
         return False
+    
+    return specifier is None or specifier.contains(version, prereleases=True)
 
 def check_package(package_name):
     """Check if a package is already installed"""
@@ -39,7 +87,8 @@ def main():
         "sentencepiece>=0.1.99",
         "protobuf>=3.20.0",
         "safetensors>=0.3.0",
-        "tokenizers>=0.14.0"
+        "tokenizers>=0.14.0",
+        "optimum>=1.14.0,<2"
     ]
     
     # Check Python version
@@ -49,17 +98,24 @@ def main():
     
     print(f"✅ Python {sys.version} detected")
     
-    # Install packages
+    # Install only the packages that are missing or too old
     failed_packages = []
+    missing = []
     for package in packages:
         package_name = package.split(">=")[0].split("==")[0]
-        print(f"📦 Installing {package}...")
+        if is_satisfied(package):
+            print(f"   ✅ {package_name} already installed")
+        else:
+            missing.append(package)
+    
+    if missing:
+        print(f"📦 Installing {', '.join(missing)}...")
         
-        if install_package(package):
-            print(f"   ✅ {package_name} installed successfully")
+        if install_packages(missing):
+            print("   ✅ Packages installed successfully")
         else:
-            print(f"   ❌ Failed to install {package_name}")
-            failed_packages.append(package)
+            print("   ❌ Failed to install packages")
+            failed_packages.extend(missing)
     
     if failed_packages:
         print(f"\n❌ Failed to install: {', '.join(failed_packages)}")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Check the continuous batcher against plain generate
+Builds a tiny random GPT-2 locally (no download), serves a few prompts with
+staggered admission and shared prefixes, and compares the greedy tokens of
+every request with a per-prompt model.generate call. Also checks that one
+LocalLLM can answer generate_response more than once.
+
+Usage: python check_batcher.py
+"""
+
+import sys
+import tempfile
+
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+from transformers_llm import ContinuousBatcher, LocalLLM, _Sequence
+
+class _Pending:
+    """Stand-in for an asyncio future; step() never touches it"""
+    
+    def done(self):
+        return False
+
+class _Float32LLM(LocalLLM):
+    """Batched and single-row kernels round differently in BF16, so compare in FP32"""
+    
+    def _default_dtype(self):
+        return torch.float32
+
+def build_tiny_model(path):
+    """Save a random two-layer GPT-2 and a small byte-level BPE tokenizer to path"""
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    corpus = [
+        "User: hello there\nBot: hi how are you",
+        "Question: what is your name\nAnswer: John Smith",
+        "email john@example.com phone 555 1234"
+    ] * 50
+    tokenizer.train_from_iterator(corpus, trainers.BpeTrainer(
+        vocab_size=300,
+        special_tokens=["<|endoftext|>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    ))
+    
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        eos_token="<|endoftext|>",
+        bos_token="<|endoftext|>",
+        model_input_names=["input_ids", "attention_mask"]
+    )
+    tokenizer.save_pretrained(path)
+    
+    config = GPT2Config(
+        vocab_size=len(tokenizer),
+        n_positions=256,
+        n_embd=32,
+        n_layer=2,
+        n_head=2,
+        initializer_range=0.8,
+        eos_token_id=tokenizer.eos_token_id,
+        bos_token_id=tokenizer.eos_token_id
+    )
+    GPT2LMHeadModel(config).save_pretrained(path)
+
+def check(model_path):
+    """Return True if every batched request matches its per-prompt generate"""
+    llm = _Float32LLM(model_name=model_path, compile_model=False)
+    batcher = ContinuousBatcher(llm, max_batch_size=4)
+    
+    # Record how many prompt tokens each prefill reuses from the prefix cache
+    prefix_hits = []
+    match_prefix = batcher._match_prefix
+    def spy(ids):
+        prefix_len, past = match_prefix(ids)
+        prefix_hits.append(prefix_len)
+        return prefix_len, past
+    batcher._match_prefix = spy
+    
+    base = "what is your name john smith email john@example.com phone 555 1234 "
+    requests = [
+        (base + "hello", 6),
+        (base + "hi how are you", 9),
+        (base + "question", 4),
+        (base, 7),
+        ("User: hello there", 5)
+    ]
+    # Temperature 0 makes sampling greedy, so the tokens are comparable
+    sequences = [_Sequence(prompt, _Pending(), n, 0.0, 1.0) for prompt, n in requests]
+    # Admit requests on different steps so rows join a batch that is already decoding
+    admissions = {0: sequences[:1], 1: sequences[1:3], 3: sequences[3:4], 5: sequences[4:]}
+    
+    done = set()
+    step = 0
+    while len(done) < len(sequences):
+        finished, _ = batcher.step(admissions.get(step, []))
+        done.update(id(sequence) for sequence, _ in finished)
+        step += 1
+    
+    ok = True
+    for sequence in sequences:
+        input_ids = llm.tokenizer(llm._format_prompt(sequence.prompt), return_tensors="pt").input_ids
+        output_ids = llm.model.generate(
+            input_ids=input_ids,
+            attention_mask=input_ids.new_ones(input_ids.shape),
+            max_new_tokens=sequence.max_new_tokens,
+            do_sample=False,
+            pad_token_id=llm.pad_token_id
+        )
+        expected = output_ids[0, input_ids.shape[1]:].tolist()
+        if sequence.generated != expected:
+            print(f"Mismatch for {sequence.prompt!r}: {sequence.generated} != {expected}")
+            ok = False
+    
+    if not any(prefix_hits):
+        print("Prefix cache was never hit")
+        ok = False
+    
+    print(f"Prefix tokens reused per request: {prefix_hits}")
+    return ok
+
+def check_generate_twice(model_path):
+    """Return True if a reused LocalLLM keeps answering (the static cache is reset each time)"""
+    llm = _Float32LLM(model_name=model_path, compile_model=False)
+    
+    ok = True
+    for attempt in range(2):
+        response = llm.generate_response("what is your name", max_length=5)
+        if response.startswith("Error:"):
+            print(f"generate_response call {attempt + 1} failed: {response}")
+            ok = False
+    return ok
+
+def main():
+    with tempfile.TemporaryDirectory() as path:
+        build_tiny_model(path)
+        ok = check(path)
+        ok = check_generate_twice(path) and ok
+    
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
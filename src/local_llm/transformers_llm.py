@@ -5,22 +5,73 @@ No cmake, no external software - pure Python solution
 """
 
 import json
+import os
+import signal
+import stat
 import sys
 import argparse
+import asyncio
+
+# Thread pools read these at import time, so set them before importing torch.
+# Tokenizer threads would otherwise compete with the matmul threads.
+os.environ.setdefault("OMP_NUM_THREADS", str(os.cpu_count() or 4))
+os.environ.setdefault("MKL_NUM_THREADS", str(os.cpu_count() or 4))
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
 import torch
 from transformers import (
     AutoTokenizer, 
     AutoModelForCausalLM, 
-    pipeline,
+    StoppingCriteria,
+    StoppingCriteriaList,
     set_seed
 )
+import importlib.util
 import warnings
+from collections import OrderedDict
+
+try:
+    from transformers import StaticCache
+except ImportError:
+    # StaticCache requires transformers>=4.38
+    StaticCache = None
+
+try:
+    from transformers import DynamicCache
+except ImportError:
+    # Cache classes require transformers>=4.36; older models take tuples
+    DynamicCache = None
+
+try:
+    from transformers import TorchAoConfig
+except ImportError:
+    # TorchAoConfig requires transformers>=4.45 and the torchao package
+    TorchAoConfig = None
 
 # Suppress warnings for cleaner output
 warnings.filterwarnings("ignore")
 
+# Natural ending points for a reply
+STOP_STRINGS = ["\nUser:", "\nQuestion:", "\n\n", "<|user|>", "<|endoftext|>"]
+
+# Generation options a serve-mode request may set
+REQUEST_FIELDS = ("prompt", "max_length", "temperature", "top_p")
+
+class StopOnTokens(StoppingCriteria):
+    """Stop generating a row once its generated tokens end with a stop sequence"""
+    
+    def __init__(self, ends_with_stop, prompt_len):
+        self.ends_with_stop = ends_with_stop
+        self.prompt_len = prompt_len
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        # Only look past the prompt, so a stop sequence never straddles the template
+        done = [self.ends_with_stop(row[self.prompt_len:].tolist()) for row in input_ids]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
 class LocalLLM:
-    def __init__(self, model_name="microsoft/DialoGPT-medium"):
+    def __init__(self, model_name="microsoft/DialoGPT-medium", max_cache_len=1024, compile_model=False,
+                 quant=None, seed=None):
         """
         Initialize local LLM with lightweight models
         
@@ -30,9 +81,26 @@ class LocalLLM:
         - gpt2-medium (~1.4GB)
         - distilgpt2 (smaller, ~300MB)
         - TinyLlama/TinyLlama-1.1B-Chat-v1.0 (~1.1GB)
+        
+        max_cache_len bounds prompt + generated tokens and sizes the
+        pre-allocated KV cache. compile_model enables torch.compile of the
+        forward pass on CUDA (torch>=2.1, static cache only); compiling takes
+        far longer than one reply, so it only pays off when many prompts are
+        answered through generate_response. quant selects
+        torchao weight-only quantization ("int8_weight_only" or
+        "int4_weight_only"). seed, if given, seeds all RNGs once so sampled
+        outputs are reproducible.
         """
         self.model_name = model_name
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._prompt_template = self._resolve_prompt_template(model_name)
+        
+        # Seed once at startup rather than per request, so samples still vary
+        if seed is not None:
+            set_seed(seed)
+        
+        if self.device == "cpu":
+            self._configure_cpu_threads()
         
         print(f"Loading model: {model_name} on {self.device}", file=sys.stderr)
         
@@ -47,25 +115,39 @@ class LocalLLM:
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
             
-            # Load model with optimizations
-            self.model = AutoModelForCausalLM.from_pretrained(
-                model_name,
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                device_map="auto" if self.device == "cuda" else None,
-                low_cpu_mem_usage=True
-            )
+            # Token ids for the stop strings, so generation halts on them directly
+            self.stop_token_ids = [ids for ids in map(self._stop_ids, STOP_STRINGS) if ids]
+            
+            # Pre-tokenize the fixed parts of the prompt template
+            self.pad_token_id = self.tokenizer.pad_token_id
+            self.prompt_template_ids = self._tokenize_prompt_template()
+            
+            # Load model with optimizations; weights stream straight onto the device
+            model_kwargs = {
+                "torch_dtype": self._default_dtype(),
+                "device_map": {"": self.device},
+                "low_cpu_mem_usage": True
+            }
+            model_kwargs.update(self._quantization_kwargs(quant))
+            
+            self.model = self._load_model(model_name, model_kwargs)
+            self.model.eval()
+            
+            self.model = self._apply_bettertransformer(self.model)
             
-            # Move to device if not using device_map
             if self.device == "cpu":
-                self.model = self.model.to(self.device)
-            
-            # Create generation pipeline
-            self.generator = pipeline(
-                "text-generation",
-                model=self.model,
-                tokenizer=self.tokenizer,
-                device=0 if self.device == "cuda" else -1
-            )
+                self.model = self._apply_ipex(self.model)
+            
+            # Never allocate more cache than the model has positions for
+            model_max = getattr(self.model.config, "max_position_embeddings", None) \
+                or getattr(self.model.config, "n_positions", None)
+            self.max_cache_len = min(max_cache_len, model_max) if model_max else max_cache_len
+            
+            # Pre-allocated KV cache, created on first use
+            self.cache = None
+            
+            if compile_model:
+                self._compile_model()
             
             print(f"Model loaded successfully!", file=sys.stderr)
             
@@ -76,78 +158,753 @@ class LocalLLM:
     def generate_response(self, prompt, max_length=150, temperature=0.7, top_p=0.9):
         """Generate response from the local LLM"""
         try:
-            # Set random seed for reproducibility
-            set_seed(42)
-            
-            # Format prompt for better responses
-            formatted_prompt = self._format_prompt(prompt)
+            # max_length counts generated tokens only; leave room for them in the cache
+            max_new_tokens = min(max_length, self.max_cache_len - 1)
+            prompt_ids = self._encode_prompt(prompt)[-(self.max_cache_len - max_new_tokens):]
+            input_ids = self._to_device(torch.tensor([prompt_ids]))
+            prompt_len = input_ids.shape[1]
             
-            # Generate response
-            with torch.no_grad():
-                response = self.generator(
-                    formatted_prompt,
-                    max_length=max_length,
+            # Generate response. The cache tensors become inference tensors on
+            # first use, so they can only be reset inside inference mode.
+            with torch.inference_mode():
+                generate_kwargs = {}
+                cache = self._get_cache()
+                if cache is not None:
+                    cache.reset()
+                    generate_kwargs["past_key_values"] = cache
+                
+                output_ids = self.model.generate(
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    max_new_tokens=max_new_tokens,
                     temperature=temperature,
                     top_p=top_p,
                     do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    num_return_sequences=1,
-                    truncation=True
+                    pad_token_id=self.pad_token_id,
+                    use_cache=True,
+                    stopping_criteria=StoppingCriteriaList([StopOnTokens(self._ends_with_stop, prompt_len)]),
+                    **generate_kwargs
                 )
             
-            # Extract generated text
-            generated_text = response[0]['generated_text']
+            # Decode only the newly generated tokens
+            generated_text = self.tokenizer.decode(output_ids[0, prompt_len:], skip_special_tokens=True)
             
             # Clean up the response
-            cleaned_response = self._clean_response(generated_text, formatted_prompt)
-            
-            return cleaned_response
+            return self._clean_response(generated_text)
             
         except Exception as e:
             print(f"Error generating response: {e}", file=sys.stderr)
             return f"Error: Could not generate response - {str(e)}"
     
-    def _format_prompt(self, prompt):
-        """Format prompt based on model type"""
-        if "DialoGPT" in self.model_name:
-            return f"User: {prompt}\nBot:"
-        elif "TinyLlama" in self.model_name or "chat" in self.model_name.lower():
-            return f"<|user|>\n{prompt}\n<|assistant|>\n"
+    def _load_model(self, model_name, model_kwargs):
+        """Load the model with the fastest attention kernel it supports"""
+        attn_implementations = ["sdpa", None]
+        if self.device == "cuda" and importlib.util.find_spec("flash_attn") is not None:
+            attn_implementations.insert(0, "flash_attention_2")
+        
+        for attn_implementation in attn_implementations:
+            if attn_implementation is None:
+                return AutoModelForCausalLM.from_pretrained(model_name, **model_kwargs)
+            
+            try:
+                model = AutoModelForCausalLM.from_pretrained(
+                    model_name,
+                    attn_implementation=attn_implementation,
+                    **model_kwargs
+                )
+                print(f"Using {attn_implementation} attention", file=sys.stderr)
+                return model
+            except (ValueError, ImportError, TypeError) as e:
+                print(f"{attn_implementation} attention unavailable: {e}", file=sys.stderr)
+    
+    def _default_dtype(self):
+        """FP16 on CUDA, BF16 on CPUs with native BF16 matmul, FP32 otherwise"""
+        if self.device == "cuda":
+            return torch.float16
+        
+        # Only trust hardware support; emulated BF16 is slower than FP32
+        cpu = getattr(torch, "cpu", None)
+        for check in ("_is_avx512_bf16_supported", "_is_amx_tile_supported"):
+            if getattr(cpu, check, lambda: False)():
+                return torch.bfloat16
+        return torch.float32
+    
+    def _configure_cpu_threads(self):
+        """Use every core for intra-op work and skip the inter-op pool"""
+        torch.set_num_threads(os.cpu_count() or 4)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Can only be set before any inter-op work has started
+            pass
+    
+    def _apply_ipex(self, model):
+        """Use Intel Extension for PyTorch CPU kernels when it is installed"""
+        try:
+            import intel_extension_for_pytorch as ipex
+        except ImportError:
+            return model
+        
+        try:
+            dtype = model.dtype if model.dtype in (torch.bfloat16, torch.float16) else None
+            model = ipex.optimize(model.eval(), dtype=dtype, inplace=True)
+            print("Using Intel Extension for PyTorch", file=sys.stderr)
+        except Exception as e:
+            print(f"Intel Extension for PyTorch unavailable: {e}", file=sys.stderr)
+        return model
+    
+    def _apply_bettertransformer(self, model):
+        """Swap in optimum's fused attention when no native fused kernel is in use"""
+        if getattr(model.config, "_attn_implementation", "eager") != "eager":
+            return model
+        
+        try:
+            from optimum.bettertransformer import BetterTransformer
+        except ImportError:
+            return model
+        
+        try:
+            model = BetterTransformer.transform(model)
+            print("Using BetterTransformer attention", file=sys.stderr)
+        except Exception as e:
+            print(f"BetterTransformer unavailable: {e}", file=sys.stderr)
+        return model
+    
+    def _quantization_kwargs(self, quant):
+        """Build from_pretrained kwargs for torchao weight-only quantization"""
+        if not quant:
+            return {}
+        
+        if TorchAoConfig is None or importlib.util.find_spec("torchao") is None:
+            print(f"Quantization '{quant}' needs torchao and transformers>=4.45, loading unquantized", file=sys.stderr)
+            return {}
+        
+        # torchao's int4 weight-only kernels are CUDA-only
+        if quant.startswith("int4") and self.device != "cuda":
+            print(f"Quantization '{quant}' needs CUDA, loading unquantized", file=sys.stderr)
+            return {}
+        
+        config_kwargs = {"group_size": 128} if quant.startswith("int4") else {}
+        try:
+            quantization_config = TorchAoConfig(quant_type=quant, **config_kwargs)
+        except Exception as e:
+            print(f"Quantization '{quant}' unavailable, loading unquantized: {e}", file=sys.stderr)
+            return {}
+        
+        quant_kwargs = {"quantization_config": quantization_config}
+        # Keep FP32 on CPUs without native BF16, where BF16 is emulated and slower
+        if self.device == "cuda" or self._default_dtype() == torch.bfloat16:
+            quant_kwargs["torch_dtype"] = torch.bfloat16
+        return quant_kwargs
+    
+    def _get_cache(self):
+        """Return the StaticCache, allocating it on first use"""
+        if self.cache is None:
+            self.cache = self._create_static_cache()
+        return self.cache
+    
+    def _create_static_cache(self):
+        """Allocate a StaticCache for the model, or None to use the default dynamic cache"""
+        # transformers<5 marks models that cannot take a Cache object (e.g. GPT-2)
+        if StaticCache is None or not getattr(self.model, "_supports_static_cache", True):
+            return None
+        
+        try:
+            return StaticCache(
+                config=self.model.config,
+                max_batch_size=1,
+                max_cache_len=self.max_cache_len,
+                device=self.device,
+                dtype=self.model.dtype
+            )
+        except Exception as e:
+            print(f"Static KV cache unavailable, using dynamic cache: {e}", file=sys.stderr)
+            return None
+    
+    def _compile_model(self):
+        """Compile the decode forward into CUDA graphs and warm it up"""
+        if self.device != "cuda" or torch.__version__ < "2.1":
+            return
+        
+        cache = self._get_cache()
+        if cache is None:
+            return
+        
+        eager_forward = self.model.forward
+        try:
+            self.model.forward = torch.compile(
+                eager_forward,
+                mode="reduce-overhead",
+                fullgraph=True,
+                dynamic=False
+            )
+            
+            # The first calls trigger compilation; pay for it before serving
+            print("Compiling model forward...", file=sys.stderr)
+            inputs = self.tokenizer("Hello", return_tensors="pt").to(self.device)
+            for _ in range(2):
+                with torch.inference_mode():
+                    cache.reset()
+                    self.model.generate(
+                        **inputs,
+                        max_new_tokens=4,
+                        do_sample=False,
+                        pad_token_id=self.tokenizer.eos_token_id,
+                        past_key_values=cache
+                    )
+        except Exception as e:
+            print(f"torch.compile failed, using eager mode: {e}", file=sys.stderr)
+            self.model.forward = eager_forward
+    
+    def _ends_with_stop(self, generated):
+        """True if the generated token ids end with a stop sequence that follows some text"""
+        for ids in self.stop_token_ids:
+            if len(generated) >= len(ids) and generated[-len(ids):] == ids:
+                # Leading whitespace is stripped from the reply, so a stop there does not end it
+                if self.tokenizer.decode(generated[:-len(ids)], skip_special_tokens=True).strip():
+                    return True
+        return False
+    
+    def _stop_ids(self, stop_string):
+        """
+        Token ids a stop string gets when it follows other text. SentencePiece
+        tokenizers mark the start of the input (e.g. a leading "▁"), so encoding
+        the stop string on its own can give ids the model never generates.
+        """
+        context = "Hello"
+        context_ids = self.tokenizer.encode(context, add_special_tokens=False)
+        ids = self.tokenizer.encode(context + stop_string, add_special_tokens=False)
+        if ids[:len(context_ids)] != context_ids:
+            # The stop string merged with the context; fall back to encoding it alone
+            return self.tokenizer.encode(stop_string, add_special_tokens=False)
+        return ids[len(context_ids):]
+    
+    def _tokenize_prompt_template(self):
+        """
+        Tokenize the text around the user prompt once, so requests only encode
+        the prompt itself. Returns (prefix_ids, lead, suffix_ids), or None if
+        tokenizing the parts separately does not reproduce the full encoding.
+        """
+        prefix, suffix = self._prompt_template.split("{}")
+        
+        # Keep whitespace before the prompt with the prompt, where BPE attaches it
+        stripped = prefix.rstrip()
+        lead = prefix[len(stripped):]
+        template_ids = (
+            self.tokenizer.encode(stripped),
+            lead,
+            self.tokenizer.encode(suffix, add_special_tokens=False)
+        )
+        
+        sample = "My name is John Smith and my email is john@example.com"
+        prefix_ids, _, suffix_ids = template_ids
+        sample_ids = prefix_ids + self.tokenizer.encode(lead + sample, add_special_tokens=False) + suffix_ids
+        if sample_ids != self.tokenizer.encode(self._format_prompt(sample)):
+            return None
+        return template_ids
+    
+    def _encode_prompt(self, prompt):
+        """Token ids for the formatted prompt"""
+        if self.prompt_template_ids is None:
+            return self.tokenizer.encode(self._format_prompt(prompt))
+        
+        prefix_ids, lead, suffix_ids = self.prompt_template_ids
+        return prefix_ids + self.tokenizer.encode(lead + prompt, add_special_tokens=False) + suffix_ids
+    
+    def _to_device(self, tensor):
+        """Copy a host tensor to the model device without stalling the CUDA stream"""
+        if self.device == "cuda":
+            return tensor.pin_memory().to(self.device, non_blocking=True)
+        return tensor
+    
+    @staticmethod
+    def _resolve_prompt_template(model_name):
+        """Pick the prompt format for the model type once, at construction"""
+        if "DialoGPT" in model_name:
+            return "User: {}\nBot:"
+        elif "TinyLlama" in model_name or "chat" in model_name.lower():
+            return "<|user|>\n{}\n<|assistant|>\n"
         else:
             # Generic format for GPT-2 style models
-            return f"Question: {prompt}\nAnswer:"
+            return "Question: {}\nAnswer:"
     
-    def _clean_response(self, generated_text, original_prompt):
+    def _format_prompt(self, prompt):
+        """Format prompt based on model type"""
+        return self._prompt_template.format(prompt)
+    
+    def _clean_response(self, response):
         """Clean up the generated response"""
-        # Remove the original prompt
-        if generated_text.startswith(original_prompt):
-            response = generated_text[len(original_prompt):].strip()
-        else:
-            response = generated_text.strip()
-        
-        # Stop at natural ending points
-        stop_tokens = ["\nUser:", "\nQuestion:", "\n\n", "<|user|>", "<|endoftext|>"]
-        for stop_token in stop_tokens:
-            if stop_token in response:
-                response = response.split(stop_token)[0]
+        # Stop at natural ending points the token-level check may have missed,
+        # ignoring any that fall inside leading whitespace
+        response = response.lstrip()
+        for stop_string in STOP_STRINGS:
+            if stop_string in response:
+                response = response.split(stop_string)[0]
         
         return response.strip()
 
+class _Sequence:
+    """A request occupying one row of a continuous batch"""
+    
+    def __init__(self, prompt, future, max_new_tokens, temperature, top_p, on_delta=None):
+        self.prompt = prompt
+        self.future = future
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.on_delta = on_delta
+        self.generated = []
+        self.streamed_text = ""
+        self.finished = False
+        self.error = None
+
+class ContinuousBatcher:
+    """
+    Decode many requests together one token at a time
+    
+    Finished rows leave the batch after every step and queued requests are
+    prefilled into the freed rows, so a short reply never waits on a long one.
+    Rows are right-aligned in the KV cache and left padding is masked out.
+    The KV of recent prompts is kept so a new prompt that shares a prefix with
+    one of them (e.g. the autofill instructions) only prefills the rest.
+    """
+    
+    def __init__(self, llm, max_batch_size=8, prefix_cache_size=4):
+        self.llm = llm
+        self.max_batch_size = max_batch_size
+        self.prefix_cache_size = prefix_cache_size
+        self.prefix_cache = OrderedDict()
+        self.queue = asyncio.Queue()
+        self.rows = []
+        self.past = None
+        self.attention_mask = None
+    
+    async def submit(self, prompt, max_length=150, temperature=0.7, top_p=0.9, on_delta=None):
+        """
+        Queue a prompt and wait for its generated text. If on_delta is given it
+        is called with each new piece of text as soon as it is decoded.
+        """
+        # Requests come straight from JSON, so check the types here rather than mid-batch
+        if prompt is None:
+            raise ValueError("prompt is required")
+        prompt = str(prompt)
+        max_length, temperature, top_p = int(max_length), float(temperature), float(top_p)
+        if max_length < 1:
+            raise ValueError("max_length must be at least 1")
+        
+        future = asyncio.get_running_loop().create_future()
+        max_new_tokens = min(max_length, self.llm.max_cache_len - 1)
+        await self.queue.put(_Sequence(prompt, future, max_new_tokens, temperature, top_p, on_delta))
+        return await future
+    
+    async def run(self):
+        """Admit queued requests and run decode steps forever"""
+        loop = asyncio.get_running_loop()
+        while True:
+            admitted = []
+            if not self.rows:
+                admitted.append(await self.queue.get())
+            while len(self.rows) + len(admitted) < self.max_batch_size and not self.queue.empty():
+                admitted.append(self.queue.get_nowait())
+            
+            try:
+                finished, deltas = await loop.run_in_executor(None, self.step, admitted)
+            except Exception as e:
+                print(f"Error generating response: {e}", file=sys.stderr)
+                for sequence in self.rows + admitted:
+                    if not sequence.future.done():
+                        sequence.future.set_exception(e)
+                self.rows, self.past, self.attention_mask = [], None, None
+                continue
+            
+            # A failing callback or an abandoned future must not stop the batcher
+            for sequence, delta in deltas:
+                try:
+                    sequence.on_delta(delta)
+                except Exception as e:
+                    print(f"Error streaming response: {e}", file=sys.stderr)
+                    sequence.on_delta = None
+            for sequence, response in finished:
+                if sequence.future.done():
+                    continue
+                if sequence.error is not None:
+                    sequence.future.set_exception(sequence.error)
+                else:
+                    sequence.future.set_result(response)
+    
+    def step(self, admitted):
+        """
+        Prefill admitted requests, then decode one token for every row.
+        Returns the finished (sequence, response) pairs, including requests
+        whose prefill failed (with sequence.error set), and the new
+        (sequence, text) deltas of streaming requests.
+        """
+        finished = []
+        with torch.inference_mode():
+            if admitted:
+                finished.extend((sequence, None) for sequence in self._prefill(admitted))
+                finished.extend(self._evict_finished())
+            if self.rows:
+                self._decode()
+                finished.extend(self._evict_finished())
+        return finished, self._stream_deltas(finished)
+    
+    def _stream_deltas(self, finished):
+        """
+        New text for each streaming request. Running rows only send text the
+        final cleanup cannot change and finished rows send the rest of their
+        response, so a request's deltas always add up to its response.
+        """
+        texts = [(sequence, self._settled_text(sequence)) for sequence in self.rows if sequence.on_delta]
+        texts += [
+            (sequence, response) for sequence, response in finished
+            if sequence.on_delta and sequence.error is None
+        ]
+        
+        deltas = []
+        for sequence, text in texts:
+            if len(text) > len(sequence.streamed_text) and text.startswith(sequence.streamed_text):
+                deltas.append((sequence, text[len(sequence.streamed_text):]))
+                sequence.streamed_text = text
+        return deltas
+    
+    def _settled_text(self, sequence):
+        """The start of a running row's response that later tokens cannot change"""
+        text = self.llm.tokenizer.decode(sequence.generated, skip_special_tokens=True).lstrip()
+        for stop_string in STOP_STRINGS:
+            text = text.split(stop_string)[0]
+        
+        # Hold back a tail that later tokens could complete into a stop string
+        for start in range(max(0, len(text) - max(map(len, STOP_STRINGS))), len(text)):
+            if any(stop_string.startswith(text[start:]) for stop_string in STOP_STRINGS):
+                text = text[:start]
+                break
+        
+        # Trailing whitespace may be stripped from the response and a trailing
+        # U+FFFD may be a partial UTF-8 character, so neither is settled yet
+        while text and (text[-1].isspace() or text[-1] == "\ufffd"):
+            text = text[:-1]
+        return text
+    
+    def _prefill(self, admitted):
+        """
+        Prefill each admitted request, reusing cached KV for a shared prefix.
+        Returns the requests that failed, so only they are answered with an
+        error while the running batch carries on.
+        """
+        llm = self.llm
+        failed = []
+        for sequence in admitted:
+            try:
+                ids = llm._encode_prompt(sequence.prompt)[-(llm.max_cache_len - sequence.max_new_tokens):]
+                prefix_len, prefix_past = self._match_prefix(ids)
+                
+                attention_mask = torch.ones((1, len(ids)), dtype=torch.long, device=llm.device)
+                outputs = llm.model(
+                    input_ids=llm._to_device(torch.tensor([ids[prefix_len:]])),
+                    attention_mask=attention_mask,
+                    position_ids=torch.arange(prefix_len, len(ids), device=llm.device).unsqueeze(0),
+                    past_key_values=self._from_legacy(prefix_past) if prefix_past is not None else None,
+                    use_cache=True
+                )
+                past = self._to_legacy(outputs.past_key_values)
+                
+                self._store_prefix(ids, past)
+                self._append_tokens([sequence], outputs.logits[:, -1, :])
+            except Exception as e:
+                print(f"Error generating response: {e}", file=sys.stderr)
+                sequence.error = e
+                failed.append(sequence)
+                continue
+            
+            self._add_row(sequence, past, attention_mask)
+        return failed
+    
+    def _match_prefix(self, ids):
+        """Find the cached prompt sharing the longest token prefix with ids"""
+        best_key, best_len = None, 0
+        for key in self.prefix_cache:
+            # Always leave at least one token to prefill so there are logits to sample
+            limit = min(len(key), len(ids) - 1)
+            common = 0
+            while common < limit and key[common] == ids[common]:
+                common += 1
+            if common > best_len:
+                best_key, best_len = key, common
+        
+        if best_key is None:
+            return 0, None
+        
+        self.prefix_cache.move_to_end(best_key)
+        past = tuple(
+            tuple(tensor[:, :, :best_len] for tensor in layer) for layer in self.prefix_cache[best_key]
+        )
+        return best_len, past
+    
+    def _store_prefix(self, ids, past):
+        """Remember a prompt's KV so later prompts can reuse its prefix"""
+        if self.prefix_cache_size <= 0:
+            return
+        
+        key = tuple(ids)
+        self.prefix_cache[key] = past
+        self.prefix_cache.move_to_end(key)
+        while len(self.prefix_cache) > self.prefix_cache_size:
+            self.prefix_cache.popitem(last=False)
+    
+    def _add_row(self, sequence, past, attention_mask):
+        """Append a prefilled request to the running batch"""
+        if not self.rows:
+            self.rows, self.past, self.attention_mask = [sequence], past, attention_mask
+            return
+        
+        # Right-align the running batch and the new row, then stack them
+        seq_len = attention_mask.shape[1]
+        total_len = max(self.attention_mask.shape[1], seq_len)
+        self.past = tuple(
+            tuple(
+                torch.cat([self._pad_left(old, total_len), self._pad_left(new, total_len)], dim=0)
+                for old, new in zip(old_layer, new_layer)
+            )
+            for old_layer, new_layer in zip(self.past, past)
+        )
+        self.attention_mask = torch.cat([
+            torch.nn.functional.pad(self.attention_mask, (total_len - self.attention_mask.shape[1], 0)),
+            torch.nn.functional.pad(attention_mask, (total_len - seq_len, 0))
+        ], dim=0)
+        self.rows = self.rows + [sequence]
+    
+    def _decode(self):
+        llm = self.llm
+        input_ids = llm._to_device(torch.tensor([[sequence.generated[-1]] for sequence in self.rows]))
+        position_ids = self.attention_mask.sum(-1, keepdim=True)
+        self.attention_mask = torch.nn.functional.pad(self.attention_mask, (0, 1), value=1)
+        
+        outputs = llm.model(
+            input_ids=input_ids,
+            attention_mask=self.attention_mask,
+            position_ids=position_ids,
+            past_key_values=self._from_legacy(self.past),
+            use_cache=True
+        )
+        self.past = self._to_legacy(outputs.past_key_values)
+        self._append_tokens(self.rows, outputs.logits[:, -1, :])
+    
+    def _append_tokens(self, sequences, logits):
+        """Sample one token per row with that row's temperature and top_p"""
+        temperature = self.llm._to_device(torch.tensor([sequence.temperature for sequence in sequences]))
+        top_p = self.llm._to_device(torch.tensor([sequence.top_p for sequence in sequences]))
+        
+        probs = torch.softmax(logits.float() / temperature.clamp(min=1e-5).unsqueeze(1), dim=-1)
+        sorted_probs, sorted_ids = probs.sort(dim=-1, descending=True)
+        sorted_probs[(sorted_probs.cumsum(-1) - sorted_probs) > top_p.unsqueeze(1)] = 0
+        next_tokens = sorted_ids.gather(-1, torch.multinomial(sorted_probs, 1)).squeeze(1).tolist()
+        
+        eos_token_id = self.llm.tokenizer.eos_token_id
+        for sequence, token in zip(sequences, next_tokens):
+            sequence.generated.append(token)
+            sequence.finished = (
+                token == eos_token_id
+                or len(sequence.generated) >= sequence.max_new_tokens
+                or self.llm._ends_with_stop(sequence.generated)
+            )
+    
+    def _evict_finished(self):
+        """Drop finished rows from the batch and return their responses"""
+        if not any(sequence.finished for sequence in self.rows):
+            return []
+        
+        keep = [row for row, sequence in enumerate(self.rows) if not sequence.finished]
+        finished = [
+            (sequence, self._response(sequence)) for sequence in self.rows if sequence.finished
+        ]
+        
+        self.rows = [self.rows[row] for row in keep]
+        if not self.rows:
+            self.past, self.attention_mask = None, None
+            return finished
+        
+        index = torch.tensor(keep, device=self.attention_mask.device)
+        self.attention_mask = self.attention_mask.index_select(0, index)
+        self.past = tuple(
+            tuple(tensor.index_select(0, index) for tensor in layer) for layer in self.past
+        )
+        
+        # Trim columns that are now padding in every remaining row
+        start = int(self.attention_mask.any(dim=0).int().argmax())
+        if start:
+            self.attention_mask = self.attention_mask[:, start:]
+            self.past = tuple(tuple(tensor[:, :, start:] for tensor in layer) for layer in self.past)
+        
+        return finished
+    
+    def _response(self, sequence):
+        llm = self.llm
+        generated_text = llm.tokenizer.decode(sequence.generated, skip_special_tokens=True)
+        return llm._clean_response(generated_text)
+    
+    @staticmethod
+    def _to_legacy(past):
+        """Convert a model cache to a tuple of per-layer (key, value) tensors"""
+        if hasattr(past, "to_legacy_cache"):
+            return past.to_legacy_cache()
+        if hasattr(past, "layers"):
+            # transformers>=5 dropped the legacy conversion helpers
+            return tuple((layer.keys, layer.values) for layer in past.layers)
+        return past
+    
+    @staticmethod
+    def _from_legacy(past):
+        """Wrap per-layer (key, value) tensors in the cache type the model expects"""
+        if DynamicCache is None:
+            return past
+        if hasattr(DynamicCache, "from_legacy_cache"):
+            return DynamicCache.from_legacy_cache(past)
+        return DynamicCache(past)
+    
+    @staticmethod
+    def _pad_left(tensor, length):
+        return torch.nn.functional.pad(tensor, (0, 0, length - tensor.shape[2], 0))
+
+async def _handle_request(batcher, line, model_name, respond):
+    """Answer a single JSON request line"""
+    request_id = None
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        
+        request_id = request.pop("id", None)
+        on_delta = None
+        if request.pop("stream", False):
+            on_delta = lambda delta: respond(json.dumps({"id": request_id, "delta": delta}))
+        
+        unknown = sorted(set(request) - set(REQUEST_FIELDS))
+        if unknown:
+            raise ValueError(f"Unknown request fields: {', '.join(unknown)}")
+        
+        response = await batcher.submit(**request, on_delta=on_delta)
+        result = {"id": request_id, "text": response, "model": model_name}
+    except Exception as e:
+        result = {"id": request_id, "error": str(e)}
+    
+    respond(json.dumps(result))
+
+async def _serve_lines(batcher, read_line, model_name, respond):
+    """Dispatch request lines until read_line returns EOF"""
+    pending = set()
+    while True:
+        line = await read_line()
+        if not line:
+            break
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        
+        task = asyncio.create_task(_handle_request(batcher, line, model_name, respond))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    
+    if pending:
+        await asyncio.gather(*pending)
+
+async def _serve(llm, model_name, socket_path=None, max_batch_size=8):
+    batcher = ContinuousBatcher(llm, max_batch_size=max_batch_size)
+    worker = asyncio.create_task(batcher.run())
+    
+    if socket_path is None:
+        loop = asyncio.get_running_loop()
+        await _serve_lines(
+            batcher,
+            lambda: loop.run_in_executor(None, sys.stdin.readline),
+            model_name,
+            lambda result: print(result, flush=True)
+        )
+        worker.cancel()
+        return
+    
+    async def handle_connection(reader, writer):
+        await _serve_lines(
+            batcher,
+            reader.readline,
+            model_name,
+            lambda result: writer.write((result + "\n").encode("utf-8"))
+        )
+        writer.close()
+    
+    # Remove a socket left behind by a previous run, but never any other file
+    if os.path.lexists(socket_path):
+        if not _is_socket(socket_path):
+            raise FileExistsError(f"{socket_path} exists and is not a socket")
+        os.unlink(socket_path)
+    
+    server = await asyncio.start_unix_server(handle_connection, path=socket_path, limit=2 ** 20)
+    
+    # Shut down cleanly on SIGTERM too, so the socket file gets removed
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    print(f"Serving {model_name} on {socket_path}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        worker.cancel()
+        if _is_socket(socket_path):
+            os.unlink(socket_path)
+
+def _is_socket(path):
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+def serve(llm, model_name, socket_path=None, max_batch_size=8):
+    """Serve newline-delimited JSON requests from stdin, or a Unix socket if given"""
+    try:
+        asyncio.run(_serve(llm, model_name, socket_path, max_batch_size))
+    except asyncio.CancelledError:
+        pass
+
 def main():
     parser = argparse.ArgumentParser(description="Local LLM using Hugging Face Transformers")
-    parser.add_argument("prompt", help="Input prompt for the LLM")
+    parser.add_argument("prompt", nargs="?", help="Input prompt for the LLM")
     parser.add_argument("--model", default="microsoft/DialoGPT-medium", 
                        help="Model name from Hugging Face")
     parser.add_argument("--max-length", type=int, default=150,
-                       help="Maximum length of generated text")
+                       help="Maximum number of new tokens to generate")
     parser.add_argument("--temperature", type=float, default=0.7,
                        help="Temperature for sampling (0.0 to 1.0)")
+    parser.add_argument("--quant", choices=["int8_weight_only", "int4_weight_only"],
+                       help="Weight-only quantization via torchao")
+    parser.add_argument("--compile", action="store_true",
+                       help="Compile the model forward with torch.compile on CUDA (slow start)")
+    parser.add_argument("--seed", type=int, default=None,
+                       help="Random seed for reproducible sampling")
+    parser.add_argument("--serve", action="store_true",
+                       help="Load the model once and serve JSON lines from stdin")
+    parser.add_argument("--socket", metavar="PATH",
+                       help="Load the model once and serve JSON lines on a Unix socket")
+    parser.add_argument("--max-batch-size", type=int, default=8,
+                       help="Maximum number of requests decoded together when serving")
     
     args = parser.parse_args()
     
+    if not (args.serve or args.socket) and args.prompt is None:
+        parser.error("prompt is required unless --serve or --socket is given")
+    
+    # The compiled forward is specialised to the static cache's shapes,
+    # which the serve-mode batcher never uses
+    if (args.serve or args.socket) and args.compile:
+        parser.error("--compile only applies to one-shot prompts, not --serve or --socket")
+    
     try:
         # Initialize LLM
-        llm = LocalLLM(model_name=args.model)
+        llm = LocalLLM(model_name=args.model, quant=args.quant, seed=args.seed, compile_model=args.compile)
+        
+        if args.serve or args.socket:
+            serve(llm, args.model, args.socket, args.max_batch_size)
+            return
         
         # Generate response
         response = llm.generate_response(
@@ -2,6 +2,7 @@ const OpenAI = require('openai');
 const { GoogleGenerativeAI } = require('@google/generative-ai');
 const Anthropic = require('@anthropic-ai/sdk');
 const { spawn } = require('child_process');
+const net = require('net');
 const path = require('path');
 const ExternalLLMService = require('./ExternalLLMService');
 
@@ -12,6 +13,8 @@ class LLMService {
         this.providers = {};
         this.currentProvider = null;
         this.localLLMEnabled = process.env.LOCAL_LLM_ENABLED === 'true';
+        this.localWorkers = {};
+        this.localRequestId = 0;
         
         // Initialize external LLM service for remote/external providers
         this.externalLLMService = new ExternalLLMService();
@@ -259,18 +262,22 @@ Suggested value:`;
             // Get model from options or use default
             const model = options.model || provider.defaultModel;
             
-            // Call Python script for Transformers inference
-            const result = await this.callPythonScript(provider.pythonScript, [
+            // Send request to the persistent Python worker for this model
+            const result = await this.callLocalWorker(provider.pythonScript, model, {
                 prompt,
-                '--model', model,
-                '--max-length', maxTokens.toString(),
-                '--temperature', temperature.toString()
-            ]);
+                max_length: maxTokens,
+                temperature
+            });
 
             if (result.error) {
                 throw new Error(result.error);
             }
 
+            // A shared socket daemon serves whichever model it was started with
+            if (result.model && result.model !== model) {
+                logger.warn(`Local LLM daemon serves ${result.model}, not the requested ${model}`);
+            }
+
             if (result.text) {
                 return { text: result.text };
             } else {
@@ -332,6 +339,106 @@ Suggested value:`;
         });
     }
 
+    getLocalWorker(scriptPath, model) {
+        const socketPath = process.env.LOCAL_LLM_SOCKET;
+        const key = socketPath ? `socket:${socketPath}` : model;
+        if (this.localWorkers[key]) {
+            return this.localWorkers[key];
+        }
+
+        const worker = { input: null, pending: new Map(), buffer: '' };
+
+        const failPending = (error) => {
+            if (this.localWorkers[key] === worker) {
+                delete this.localWorkers[key];
+            }
+            for (const request of worker.pending.values()) {
+                request.reject(error);
+            }
+            worker.pending.clear();
+        };
+
+        if (socketPath) {
+            // Share one already-running daemon (started with --socket) across Node processes
+            const socket = net.createConnection(socketPath);
+            worker.input = socket;
+
+            socket.on('data', (data) => this.handleLocalWorkerOutput(worker, data));
+
+            socket.on('close', () => {
+                failPending(new Error('Local LLM socket closed'));
+            });
+
+            socket.on('error', (error) => {
+                failPending(new Error(`Failed to connect to local LLM socket: ${error.message}`));
+            });
+        } else {
+            // Spawn one long-running Python process per model so the weights are loaded once
+            const args = [scriptPath, '--serve', '--model', model];
+            if (process.env.LOCAL_LLM_QUANT) {
+                args.push('--quant', process.env.LOCAL_LLM_QUANT);
+            }
+            const python = spawn('python', args);
+            worker.input = python.stdin;
+
+            python.stdout.on('data', (data) => this.handleLocalWorkerOutput(worker, data));
+
+            // Writes to a worker that already exited fail with EPIPE
+            python.stdin.on('error', (error) => {
+                failPending(new Error(`Local LLM worker stdin error: ${error.message}`));
+            });
+
+            python.stderr.on('data', (data) => {
+                logger.debug(`Local LLM (${model}): ${data.toString().trim()}`);
+            });
+
+            python.on('close', (code) => {
+                failPending(new Error(`Local LLM worker exited with code ${code}`));
+            });
+
+            python.on('error', (error) => {
+                failPending(new Error(`Failed to start Python script: ${error.message}`));
+            });
+        }
+
+        this.localWorkers[key] = worker;
+        return worker;
+    }
+
+    handleLocalWorkerOutput(worker, data) {
+        worker.buffer += data.toString();
+        let newlineIndex;
+        while ((newlineIndex = worker.buffer.indexOf('\n')) !== -1) {
+            const line = worker.buffer.slice(0, newlineIndex).trim();
+            worker.buffer = worker.buffer.slice(newlineIndex + 1);
+            if (!line) continue;
+
+            let result;
+            try {
+                result = JSON.parse(line);
+            } catch (parseError) {
+                logger.warn(`Failed to parse local LLM output: ${line}`);
+                continue;
+            }
+
+            const request = worker.pending.get(result.id);
+            if (request) {
+                worker.pending.delete(result.id);
+                request.resolve(result);
+            }
+        }
+    }
+
+    callLocalWorker(scriptPath, model, request) {
+        const worker = this.getLocalWorker(scriptPath, model);
+        const id = ++this.localRequestId;
+
+        return new Promise((resolve, reject) => {
+            worker.pending.set(id, { resolve, reject });
+            worker.input.write(JSON.stringify({ id, ...request }) + '\n');
+        });
+    }
+
     switchToNextProvider() {
         const providers = Object.keys(this.providers);
         const currentIndex = providers.indexOf(this.currentProvider);